@@ -0,0 +1,478 @@
+import os
+import sys
+import subprocess
+import json
+import warnings
+import logging
+import functools
+import tempfile
+import hashlib
+import concurrent.futures
+from pathlib import Path
+import numpy as np
+
+# ctranslate2 and faster_whisper are imported where they are used, so that
+# configure_threads() can set the OpenMP/MKL variables before they are loaded
+
+try:
+    import orjson
+except ImportError:  # optional, fall back to the standard library encoder
+    orjson = None
+
+try:
+    import psutil
+except ImportError:  # listed in requirements.txt, guessed from os.cpu_count() without it
+    psutil = None
+
+class TranscriptionError(Exception):
+    """Raised when a single file cannot be transcribed."""
+
+SAMPLE_RATE = 16000
+DEFAULT_MODEL = "large-v3-turbo"
+DEFAULT_GGML_MODEL = os.path.join("models", "ggml-medium-q8_0.bin")
+DEFAULT_ONNX_MODEL = os.path.join("models", "whisper-medium-ort-int8")
+DEFAULT_GGML_VAD_MODEL = os.path.join("models", "ggml-silero-v5.1.2.bin")
+CACHE_DIR = os.path.join(".cache", "transcriptions")
+# Libraries whose warnings are hidden outside of --debug
+NOISY_MODULES = r"(faster_whisper|ctranslate2|transformers|optimum|onnxruntime|torch)"
+# Formats whisper-cli can read without converting through ffmpeg first
+WHISPERCPP_FORMATS = (".wav", ".mp3", ".flac", ".ogg")
+
+def get_audio_duration(file_path):
+    """Return the duration of the file in seconds, or None if ffprobe cannot read it."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", file_path],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+    except FileNotFoundError:
+        print("\033[91m[ERROR]\033[0m ffprobe is not installed or not available in PATH.")
+        sys.exit(1)
+    except subprocess.TimeoutExpired:
+        return None
+
+    try:
+        data = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return None
+
+    # ffprobe only reports a duration for files it can actually demux
+    duration = data.get("format", {}).get("duration")
+    return float(duration) if duration is not None else None
+
+def is_supported_by_ffmpeg(file_path):
+    """Check if the file format is supported by ffmpeg."""
+    return get_audio_duration(file_path) is not None
+
+def load_audio(file_path):
+    """Decode the file to 16kHz mono float32 by streaming ffmpeg's raw PCM output."""
+    # stderr goes to a file, a pipe that is only read at the end fills up on damaged
+    # input and blocks ffmpeg while we wait on stdout
+    with tempfile.TemporaryFile() as stderr_file, subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", file_path, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        stdout=subprocess.PIPE,
+        stderr=stderr_file,
+        bufsize=1 << 20
+    ) as process:
+        # Convert 30s at a time while ffmpeg keeps decoding, int16 -> scaled float32 in one pass
+        chunk_size = SAMPLE_RATE * 30 * 2
+        chunks = []
+        while True:
+            data = process.stdout.read(chunk_size)
+            if not data:
+                break
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+            chunks.append(np.multiply(samples, 1 / 32768.0, dtype=np.float32))
+
+        process.wait()
+        # Damaged files log one line per bad frame, the last few are enough
+        stderr_file.seek(max(stderr_file.seek(0, os.SEEK_END) - 4096, 0))
+        stderr = "\n".join(stderr_file.read().decode(errors="replace").strip().splitlines()[-10:])
+
+    if process.returncode != 0:
+        raise TranscriptionError(f"ffmpeg failed to decode {file_path}." + (f"\n{stderr}" if stderr else ""))
+
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+def remove_silence(audio_array):
+    """Cut non-speech out of the audio with Silero VAD.
+
+    Returns the voiced audio and a SpeechTimestampsMap for mapping timestamps
+    in it back to the original audio, or (None, None) if no speech was found.
+    """
+    from faster_whisper.vad import SpeechTimestampsMap, get_speech_timestamps
+
+    spans = get_speech_timestamps(audio_array)
+    if not spans:
+        return None, None
+
+    voiced_audio = np.concatenate([audio_array[span["start"]:span["end"]] for span in spans])
+    return voiced_audio, SpeechTimestampsMap(spans, SAMPLE_RATE)
+
+def cuda_available():
+    """Check if CTranslate2 can see a CUDA device."""
+    import ctranslate2
+    return ctranslate2.get_cuda_device_count() > 0
+
+def prepare_output_directory(audio_file):
+    """Prepare the output directory for transcription results."""
+    base_output_dir = os.path.splitext(os.path.basename(audio_file))[0]
+    output_dir = os.path.join("Transkripte", base_output_dir)
+
+    # If directory already exists, append a counter
+    counter = 1
+    original_output_dir = output_dir
+    while os.path.exists(output_dir):
+        output_dir = f"{original_output_dir}_{counter}"
+        counter += 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+def configure_logging(debug=False):
+    """Hide the inference libraries' warnings, or show them with debug logs in debug mode."""
+    if debug:
+        logging.basicConfig(level=logging.WARNING)
+        logging.getLogger("faster_whisper").setLevel(logging.DEBUG)
+        return
+    warnings.filterwarnings("ignore", category=UserWarning, module=NOISY_MODULES)
+    warnings.filterwarnings("ignore", category=FutureWarning, module=NOISY_MODULES)
+
+def cache_key(audio_file, *parts):
+    """Build a cheap cache key from the file size, mtime and a hash of its first megabyte."""
+    stat = os.stat(audio_file)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(audio_file, "rb") as f:
+        digest.update(f.read(1 << 20))
+    for part in parts:
+        digest.update(f":{part}".encode())
+    return digest.hexdigest()
+
+def collect_segments(segments, info):
+    """Materialize faster-whisper segments into the result layout used by the writers."""
+    # segments is a lazy generator, transcription actually runs while iterating
+    result_segments = [
+        {"id": segment.id, "start": segment.start, "end": segment.end, "text": segment.text}
+        for segment in segments
+    ]
+    return {
+        "text": "".join(segment["text"] for segment in result_segments),
+        "segments": result_segments,
+        "language": info.language,
+    }
+
+def select_device(device="auto"):
+    """Pick the device and CTranslate2 compute type for the Whisper model."""
+    if device == "auto":
+        device = "cuda" if cuda_available() else "cpu"
+    elif device == "cuda" and not cuda_available():
+        print("\033[91m[ERROR]\033[0m CUDA was requested but no CUDA device is available.")
+        sys.exit(1)
+
+    # int8 weights everywhere, float16 activations on the GPU
+    if device == "cuda":
+        return "cuda", "int8_float16"
+    return "cpu", "int8"
+
+def configure_threads(threads=None):
+    """Pin the CPU thread count, defaulting to one thread per physical core."""
+    if threads is None:
+        threads = psutil.cpu_count(logical=False) if psutil is not None else None
+    if threads is None:
+        # Without psutil assume two hyperthreads per physical core
+        threads = max((os.cpu_count() or 2) // 2, 1)
+
+    # Only takes effect if set before the OpenMP runtime is loaded with ctranslate2
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+    return threads
+
+@functools.lru_cache(maxsize=1)
+def load_whisper_model(name, device, compute_type, cpu_threads=0):
+    """Load the Whisper model once and keep it around for further files."""
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+    print(f"\033[94m[INFO]\033[0m Loading Whisper model: \033[1m{name}\033[0m ({device}, {compute_type})")
+    return BatchedInferencePipeline(model=WhisperModel(name, device=device, compute_type=compute_type, cpu_threads=cpu_threads))
+
+def transcribe_with_whispercpp(audio_file, model_path, threads=None, vad_model=None, use_gpu=True, debug=False):
+    """Transcribe using the whisper.cpp CLI and return the result layout used by the writers."""
+    if not os.path.exists(model_path):
+        print(f"\033[91m[ERROR]\033[0m The whisper.cpp model \033[1m{model_path}\033[0m does not exist.")
+        sys.exit(1)
+
+    print(f"\033[94m[INFO]\033[0m Starting transcription with whisper.cpp (\033[1m{model_path}\033[0m)...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = audio_file
+        if os.path.splitext(audio_file)[1].lower() not in WHISPERCPP_FORMATS:
+            input_file = os.path.join(tmp_dir, "input.wav")
+            try:
+                conversion = subprocess.run(
+                    ["ffmpeg", "-nostdin", "-v", "error", "-i", audio_file, "-ar", str(SAMPLE_RATE), "-ac", "1", input_file],
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+            except FileNotFoundError:
+                print("\033[91m[ERROR]\033[0m ffmpeg is not installed or not available in PATH.")
+                sys.exit(1)
+            if conversion.returncode != 0:
+                stderr = conversion.stderr.strip()
+                raise TranscriptionError(f"ffmpeg failed to convert {audio_file}." + (f"\n{stderr}" if stderr else ""))
+
+        output_prefix = os.path.join(tmp_dir, "transcription")
+        command = ["whisper-cli", "-m", model_path, "-l", "de", "-oj", "-of", output_prefix, input_file]
+        if threads is not None:
+            command[1:1] = ["-t", str(threads)]
+        if vad_model is not None:
+            command[1:1] = ["--vad", "-vm", vad_model]
+        if not use_gpu:
+            command.insert(1, "-ng")
+        if not debug:
+            command.insert(1, "-np")  # Only print results, no model loading or timing logs
+        try:
+            # whisper-cli prints every segment on stdout, the transcript is read from the JSON file instead
+            result = subprocess.run(
+                command,
+                stdout=None if debug else subprocess.DEVNULL,
+                stderr=None if debug else subprocess.PIPE,
+                text=True
+            )
+        except FileNotFoundError:
+            print("\033[91m[ERROR]\033[0m whisper-cli is not installed or not available in PATH.")
+            sys.exit(1)
+        if result.returncode != 0:
+            stderr = (result.stderr or "").strip()
+            raise TranscriptionError(f"whisper.cpp failed to transcribe {audio_file}." + (f"\n{stderr}" if stderr else ""))
+
+        with open(output_prefix + ".json", encoding="utf-8") as f:
+            data = json.load(f)
+
+    # whisper.cpp reports segment offsets in milliseconds
+    result_segments = [
+        {"id": i, "start": entry["offsets"]["from"] / 1000, "end": entry["offsets"]["to"] / 1000, "text": entry["text"]}
+        for i, entry in enumerate(data["transcription"])
+    ]
+    return {
+        "text": "".join(segment["text"] for segment in result_segments),
+        "segments": result_segments,
+        "language": data.get("result", {}).get("language", "de"),
+    }
+
+@functools.lru_cache(maxsize=1)
+def load_onnx_pipeline(model_dir, device="cpu", threads=None):
+    """Load an exported ONNX Whisper model into a transformers ASR pipeline, once."""
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import AutoProcessor, pipeline
+    except ImportError:
+        print("\033[91m[ERROR]\033[0m The onnx backend needs optimum[onnxruntime] and transformers installed.")
+        sys.exit(1)
+
+    if not os.path.isdir(model_dir):
+        print(f"\033[91m[ERROR]\033[0m The ONNX model directory \033[1m{model_dir}\033[0m does not exist.")
+        sys.exit(1)
+
+    provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+    if provider not in onnxruntime.get_available_providers():
+        print("\033[91m[ERROR]\033[0m This ONNX Runtime build has no CUDA support. Install onnxruntime-gpu or pass --device cpu.")
+        sys.exit(1)
+
+    print(f"\033[94m[INFO]\033[0m Loading ONNX Whisper model: \033[1m{model_dir}\033[0m on \033[1m{device}\033[0m")
+    session_options = onnxruntime.SessionOptions()
+    if threads is not None:
+        session_options.intra_op_num_threads = threads
+
+    model = ORTModelForSpeechSeq2Seq.from_pretrained(model_dir, provider=provider, session_options=session_options)
+    processor = AutoProcessor.from_pretrained(model_dir)
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        chunk_length_s=30,
+    )
+
+def transcribe_with_onnx(audio_array, model_dir, device="cpu", threads=None, batch_size=1, vad=True):
+    """Transcribe a 16kHz mono float32 array with ONNX Runtime, in the result layout used by the writers."""
+    asr = load_onnx_pipeline(model_dir, device=device, threads=threads)
+
+    duration = audio_array.shape[0] / SAMPLE_RATE
+    timestamps_map = None
+    if vad:
+        # Only feed speech to the model, timestamps are mapped back afterwards
+        audio_array, timestamps_map = remove_silence(audio_array)
+        if audio_array is None:
+            print("\033[94m[INFO]\033[0m No speech found.")
+            return {"text": "", "segments": [], "language": "de"}
+        print(f"\033[94m[INFO]\033[0m VAD kept \033[1m{audio_array.shape[0] / SAMPLE_RATE:.1f}s\033[0m of \033[1m{duration:.1f}s\033[0m.")
+
+    print(f"\033[94m[INFO]\033[0m Starting transcription of \033[1m{duration:.1f}s\033[0m of audio with ONNX Runtime (batch size \033[1m{batch_size}\033[0m)...")
+    output = asr(
+        {"raw": audio_array, "sampling_rate": SAMPLE_RATE},
+        batch_size=batch_size,
+        return_timestamps=True,
+        generate_kwargs={"language": "german", "task": "transcribe"},
+    )
+
+    result_segments = []
+    for i, chunk in enumerate(output["chunks"]):
+        start, end = chunk["timestamp"]
+        # The last chunk has no end timestamp when the audio stops mid-sentence
+        if end is None:
+            end = audio_array.shape[0] / SAMPLE_RATE
+        if timestamps_map is not None:
+            start, end = timestamps_map.get_original_time(start), timestamps_map.get_original_time(end)
+        result_segments.append({"id": i, "start": start, "end": end, "text": chunk["text"]})
+    return {
+        "text": "".join(segment["text"] for segment in result_segments),
+        "segments": result_segments,
+        "language": "de",
+    }
+
+def write_json(result, output_file, pretty=False):
+    """Write the result as JSON in a single write, using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if pretty else 0)
+        Path(output_file).write_bytes(orjson.dumps(result, option=option))
+        return
+
+    # json.dumps instead of json.dump, which issues a write call per encoded chunk
+    Path(output_file).write_text(json.dumps(result, ensure_ascii=False, indent=2 if pretty else None), encoding="utf-8")
+
+def format_timestamps(segments):
+    """Format the "start --> end" line of every segment."""
+    return [f"{segment['start']:.3f} --> {segment['end']:.3f}" for segment in segments]
+
+def save_results(result, output_dir, pretty=False):
+    """Save the transcription as TXT, JSON, SRT and VTT, writing each file in one go."""
+    # Save JSON format, indentation only on request since it bloats the file
+    write_json(result, os.path.join(output_dir, "transcription.json"), pretty=pretty)
+
+    segments = result['segments']
+    texts = [segment['text'] for segment in segments]
+    timestamps = format_timestamps(segments)
+
+    outputs = {
+        "txt": "".join(texts),
+        "srt": "".join(f"{i + 1}\n{ts}\n{text}\n\n" for i, (ts, text) in enumerate(zip(timestamps, texts))),
+        "vtt": "WEBVTT\n\n" + "".join(f"{ts}\n{text}\n\n" for ts, text in zip(timestamps, texts)),
+    }
+    for ext, content in outputs.items():
+        Path(output_dir, f"transcription.{ext}").write_text(content, encoding="utf-8")
+
+class Transcriber:
+    """Transcribe audio files with a lazily loaded, cached Whisper model."""
+
+    def __init__(self, model_name=DEFAULT_MODEL, device="auto", batch_size=None,
+                 backend="faster-whisper", ggml_model=DEFAULT_GGML_MODEL,
+                 onnx_model=DEFAULT_ONNX_MODEL, ggml_vad_model=DEFAULT_GGML_VAD_MODEL,
+                 threads=None, vad=True, use_cache=True, debug=False):
+        self.threads = configure_threads(threads)
+        self.model_name = model_name
+        self.backend = backend
+        self.ggml_model = ggml_model
+        self.onnx_model = onnx_model
+        self.ggml_vad_model = ggml_vad_model
+        self.device, self.compute_type = select_device(device)
+        if batch_size is None:
+            batch_size = 16 if self.device == "cuda" else 8
+        self.batch_size = batch_size
+        self.vad = vad
+        self.use_cache = use_cache
+        self.debug = debug
+
+    def load_model(self):
+        """Return the Whisper model, loading it on first use."""
+        return load_whisper_model(self.model_name, self.device, self.compute_type,
+                                  cpu_threads=self.threads)
+
+    def transcribe(self, audio_array):
+        """Transcribe a 16kHz mono float32 array into the result layout used by the writers."""
+        model = self.load_model()
+
+        duration = audio_array.shape[0] / SAMPLE_RATE
+        print(f"\033[94m[INFO]\033[0m Starting transcription of \033[1m{duration:.1f}s\033[0m of audio (batch size \033[1m{self.batch_size}\033[0m)...")
+        if self.vad:
+            # Silero VAD splits the audio into speech chunks, silence is never decoded
+            segments, info = model.transcribe(audio_array, language="de", beam_size=5, batch_size=self.batch_size,
+                                              vad_filter=True)
+        else:
+            # Without VAD, batch fixed 30s windows over the whole file (clip timestamps are in samples)
+            window = 30 * SAMPLE_RATE
+            num_samples = audio_array.shape[0]
+            clip_timestamps = [{"start": start, "end": min(start + window, num_samples)}
+                               for start in range(0, num_samples, window)]
+            segments, info = model.transcribe(audio_array, language="de", beam_size=5, batch_size=self.batch_size,
+                                              vad_filter=False, clip_timestamps=clip_timestamps)
+        return collect_segments(segments, info)
+
+    def whispercpp_vad_model(self):
+        """The VAD model whisper.cpp will use, or None if VAD is off or the model is missing."""
+        if self.vad and os.path.exists(self.ggml_vad_model):
+            return self.ggml_vad_model
+        return None
+
+    def model_id(self):
+        """Identify the backend and model, so cached results are not shared between them."""
+        if self.backend == "whispercpp":
+            # Key on whether VAD actually runs, it is skipped while the VAD model is missing
+            return f"whispercpp:{self.ggml_model}:vad={self.whispercpp_vad_model() is not None}"
+        if self.backend == "onnx":
+            return f"onnx:{self.onnx_model}:vad={self.vad}"
+        return f"faster-whisper:{self.model_name}:{self.compute_type}:vad={self.vad}"
+
+    def transcribe_path(self, audio_file):
+        """Transcribe an audio file with the selected backend."""
+        if self.backend == "whispercpp":
+            if self.vad and self.whispercpp_vad_model() is None:
+                print(f"\033[94m[INFO]\033[0m VAD model \033[1m{self.ggml_vad_model}\033[0m not found, transcribing without VAD.")
+            return transcribe_with_whispercpp(audio_file, self.ggml_model, threads=self.threads,
+                                              vad_model=self.whispercpp_vad_model(), use_gpu=self.device != "cpu",
+                                              debug=self.debug)
+
+        # Decode once to 16kHz mono float32 while the model loads, the model works on the array directly
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            decoding = executor.submit(load_audio, audio_file)
+            if self.backend == "onnx":
+                load_onnx_pipeline(self.onnx_model, device=self.device, threads=self.threads)
+            else:
+                self.load_model()
+            audio_array = decoding.result()
+
+        if self.backend == "onnx":
+            return transcribe_with_onnx(audio_array, self.onnx_model, device=self.device, threads=self.threads,
+                                        batch_size=self.batch_size, vad=self.vad)
+        return self.transcribe(audio_array)
+
+    def transcribe_file(self, audio_file, output_dir, pretty=False):
+        """Perform transcription using Whisper and save results in multiple formats."""
+        cache_file = None
+        if self.use_cache:
+            cache_file = os.path.join(CACHE_DIR, f"{cache_key(audio_file, self.model_id())}.json")
+
+        result = None
+        if cache_file is not None and os.path.exists(cache_file):
+            try:
+                with open(cache_file, encoding="utf-8") as f:
+                    result = json.load(f)
+                print("\033[94m[INFO]\033[0m Reusing cached transcription of an unchanged file.")
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                print("\033[94m[INFO]\033[0m Cached transcription is damaged, transcribing again.")
+
+        if result is None:
+            result = self.transcribe_path(audio_file)
+            if cache_file is not None:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                # Write next to the entry and swap it in, so an interrupted write never leaves a truncated entry
+                tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+                write_json(result, tmp_file)
+                os.replace(tmp_file, cache_file)
+
+        save_results(result, output_dir, pretty=pretty)
+
+        print(f"\033[92m[SUCCESS]\033[0m Transcription saved successfully in \033[1m{output_dir}\033[0m")
+        return result
@@ -1,117 +1,132 @@
 import os
 import sys
-import whisper
-import subprocess
-import json
-import warnings
-
-def is_supported_by_ffmpeg(file_path):
-    """Check if the file format is supported by ffmpeg."""
-    try:
-        result = subprocess.run(
-            ["ffmpeg", "-i", file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        return "Duration:" in result.stderr  # ffmpeg outputs "Duration" for valid audio files
-    except FileNotFoundError:
-        print("\033[91m[ERROR]\033[0m ffmpeg is not installed or not available in PATH.")
-        sys.exit(1)
-
-def prepare_output_directory(audio_file):
-    """Prepare the output directory for transcription results."""
-    base_output_dir = os.path.splitext(os.path.basename(audio_file))[0]
-    output_dir = os.path.join("Transkripte", base_output_dir)
-
-    # If directory already exists, append a counter
-    counter = 1
-    original_output_dir = output_dir
-    while os.path.exists(output_dir):
-        output_dir = f"{original_output_dir}_{counter}"
-        counter += 1
-
-    os.makedirs(output_dir, exist_ok=True)
-    return output_dir
-
-def transcribe_audio(audio_file, output_dir, debug=False):
-    """Perform transcription using Whisper and save results in multiple formats."""
-    
-    print("\033[94m[INFO]\033[0m Loading Whisper model: \033[1mmedium\033[0m")
-    if debug:
-        model = whisper.load_model("medium")
-    else:
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")  # Suppress warnings
-            model = whisper.load_model("medium")
-
-    print("\033[94m[INFO]\033[0m Starting transcription...")
-    if debug:
-        result = model.transcribe(audio_file, language="de", verbose=False)
-    else:
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")  # Suppress warnings
-            result = model.transcribe(audio_file, language="de", verbose=False)
-
-    # Save text transcription
-    output_text_file = os.path.join(output_dir, "transcription.txt")
-    with open(output_text_file, "w", encoding="utf-8") as f:
-        f.write(result["text"])
-
-    # Save JSON format
-    output_json_file = os.path.join(output_dir, "transcription.json")
-    with open(output_json_file, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=4)
-
-    # Save SRT file
-    output_srt_file = os.path.join(output_dir, "transcription.srt")
-    with open(output_srt_file, "w", encoding="utf-8") as f:
-        for i, segment in enumerate(result['segments']):
-            f.write(f"{i + 1}\n")
-            f.write(f"{segment['start']:.3f} --> {segment['end']:.3f}\n")
-            f.write(f"{segment['text']}\n\n")
-
-    # Save VTT file
-    output_vtt_file = os.path.join(output_dir, "transcription.vtt")
-    with open(output_vtt_file, "w", encoding="utf-8") as f:
-        f.write("WEBVTT\n\n")
-        for segment in result['segments']:
-            f.write(f"{segment['start']:.3f} --> {segment['end']:.3f}\n")
-            f.write(f"{segment['text']}\n\n")
-
-    print(f"\033[92m[SUCCESS]\033[0m Transcription saved successfully in \033[1m{output_dir}\033[0m")
-
-def main():
-    # Check if filename is passed as an argument
-    if len(sys.argv) < 2:
-        print("\033[91m[ERROR]\033[0m Please provide the audio file name as an argument.")
-        sys.exit(1)
-
-    # Get audio file name from arguments
-    audio_file = sys.argv[1]
-
-    # Check if file exists
+import argparse
+from core import (
+    DEFAULT_GGML_MODEL, DEFAULT_GGML_VAD_MODEL, DEFAULT_MODEL, DEFAULT_ONNX_MODEL,
+    Transcriber, TranscriptionError, configure_logging, is_supported_by_ffmpeg, prepare_output_directory,
+)
+
+def check_audio_file(audio_file):
+    """Check that the audio file exists and can be decoded, printing an error otherwise."""
     if not os.path.exists(audio_file):
         print(f"\033[91m[ERROR]\033[0m The file \033[1m{audio_file}\033[0m does not exist.")
-        sys.exit(1)
+        return False
 
-    # Check if the file format is supported by ffmpeg
     if not is_supported_by_ffmpeg(audio_file):
         print(f"\033[91m[ERROR]\033[0m The file \033[1m{audio_file}\033[0m is not supported by ffmpeg or is not a valid audio file.")
-        sys.exit(1)
+        return False
 
-    # Debug flag
-    debug = "--debug" in sys.argv or "--Debug" in sys.argv
+    return True
 
+def process_file(audio_file, transcriber, pretty=False):
+    """Transcribe a single, already checked audio file with the given transcriber."""
     # Prepare output directory
     output_dir = prepare_output_directory(audio_file)
-    
+
+    try:
+        transcriber.transcribe_file(audio_file, output_dir, pretty=pretty)
+    except TranscriptionError:
+        os.rmdir(output_dir)  # Nothing was written yet, don't leave an empty folder behind
+        raise
+
+def serve(paths, transcriber, pretty=False):
+    """Transcribe every file in paths while loading the model only once."""
+    for audio_file in paths:
+        audio_file = audio_file.strip()
+        if not audio_file or not check_audio_file(audio_file):
+            continue
+
+        print(f"\033[94m[INFO]\033[0m Processing \033[1m{audio_file}\033[0m")
+        try:
+            process_file(audio_file, transcriber, pretty=pretty)
+        except TranscriptionError as e:
+            # Report and keep serving the remaining files
+            print(f"\033[91m[ERROR]\033[0m {e}")
+
+def positive_int(value):
+    """Argparse type for options that need a positive integer."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {number}")
+    return number
+
+def parse_arguments():
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description="Transcribe an audio file with Whisper.")
+    parser.add_argument("audio_file", nargs="?", help="Path to the audio file to be transcribed.")
+    parser.add_argument("--debug", "--Debug", action="store_true",
+                        help="Show warnings and detailed output.")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help=f"Whisper model for the faster-whisper backend (default: {DEFAULT_MODEL}). "
+                             "large-v3-turbo has only 4 decoder layers and is faster than medium at similar or "
+                             "better accuracy; medium needs less memory; distil-large-v3 is fastest but English-only.")
+    parser.add_argument("--backend", choices=["faster-whisper", "whispercpp", "onnx"], default="faster-whisper",
+                        help="Inference backend (default: faster-whisper). whispercpp runs the whisper-cli binary "
+                             "with quantized GGML weights, a good fit for CPU-only machines. onnx runs an exported "
+                             "model with ONNX Runtime.")
+    parser.add_argument("--ggml-model", default=DEFAULT_GGML_MODEL,
+                        help=f"GGML model file for the whispercpp backend (default: {DEFAULT_GGML_MODEL}).")
+    parser.add_argument("--ggml-vad-model", default=DEFAULT_GGML_VAD_MODEL,
+                        help=f"Silero VAD model file for the whispercpp backend (default: {DEFAULT_GGML_VAD_MODEL}).")
+    parser.add_argument("--onnx-model", default=DEFAULT_ONNX_MODEL,
+                        help=f"Exported model directory for the onnx backend (default: {DEFAULT_ONNX_MODEL}).")
+    parser.add_argument("--device", choices=["auto", "cpu", "cuda"], default="auto",
+                        help="Device to run the model on (default: cuda if available, else cpu).")
+    parser.add_argument("--threads", type=positive_int, default=None,
+                        help="Number of CPU threads (default: number of physical cores).")
+    parser.add_argument("--batch-size", type=positive_int, default=None,
+                        help="Number of 30s windows decoded in parallel (default: 16 on CUDA, 8 on CPU).")
+    parser.add_argument("--no-vad", action="store_true",
+                        help="Transcribe the whole file instead of skipping silence detected by voice activity detection.")
+    parser.add_argument("--pretty", action="store_true",
+                        help="Indent the JSON output for readability.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always transcribe, even if an unchanged file was already transcribed with the same model.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Keep the model loaded and transcribe newline-separated paths read from stdin.")
+    args = parser.parse_args()
+
+    if args.audio_file is None and not args.serve:
+        parser.error("Please provide the audio file name as an argument.")
+    return args
+
+def main():
+    args = parse_arguments()
+    configure_logging(args.debug)
+    transcriber = Transcriber(model_name=args.model, device=args.device, batch_size=args.batch_size,
+                              backend=args.backend, ggml_model=args.ggml_model,
+                              onnx_model=args.onnx_model, ggml_vad_model=args.ggml_vad_model,
+                              threads=args.threads, vad=not args.no_vad, use_cache=not args.no_cache,
+                              debug=args.debug)
+
+    if args.serve:
+        print("\033[95m========================================\033[0m")
+        print("\033[95m      SERVING TRANSCRIPTIONS FROM STDIN     \033[0m")
+        print("\033[95m========================================\033[0m")
+
+        serve(sys.stdin, transcriber, pretty=args.pretty)
+        return
+
+    # Get audio file name from arguments
+    audio_file = args.audio_file
+
+    # Check if file exists and is supported by ffmpeg
+    if not check_audio_file(audio_file):
+        sys.exit(1)
+
     print("\033[95m========================================\033[0m")
     print("\033[95m        STARTING AUDIO TRANSCRIPTION        \033[0m")
     print("\033[95m========================================\033[0m")
 
     # Perform transcription
-    transcribe_audio(audio_file, output_dir, debug=debug)
+    try:
+        process_file(audio_file, transcriber, pretty=args.pretty)
+    except TranscriptionError as e:
+        print(f"\033[91m[ERROR]\033[0m {e}")
+        sys.exit(1)
 
     print("\033[95m========================================\033[0m")
     print("\033[95m          AUDIO TRANSCRIPTION DONE          \033[0m")